@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from werkzeug.utils import secure_filename
 import os
 import json
@@ -8,6 +9,8 @@ from datetime import datetime, timedelta, date
 from dateutil.relativedelta import relativedelta
 from collections import defaultdict
 import logging
+import threading
+import time
 
 
 # ---- Flask app setup ----
@@ -40,6 +43,9 @@ os.makedirs(os.path.join(basedir, 'data'), exist_ok=True)
 os.makedirs(ROADMAPS_DIR, exist_ok=True)
 os.makedirs(os.path.join(basedir, 'data', 'roadmaps'), exist_ok=True)
 
+STREAK_JOB_BATCH_SIZE = 500
+STREAK_JOB_HOUR = 0  # local hour at which the daily streak job runs
+
 # ------------------- Database Models -------------------
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,6 +96,15 @@ class UserSession(db.Model):
     end_time = db.Column(db.DateTime)
     user = db.relationship('User', backref=db.backref('sessions', lazy=True))
 
+class StreakReminder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    roadmap_id = db.Column(db.Integer, db.ForeignKey('user_roadmap.id'), nullable=False)
+    remind_date = db.Column(db.Date, nullable=False)
+    current_streak = db.Column(db.Integer, default=0)
+    sent = db.Column(db.Boolean, default=False)
+    __table_args__ = (db.UniqueConstraint('roadmap_id', 'remind_date'),)
+
 def get_current_user():
     if 'username' not in session:
         return None
@@ -132,6 +147,162 @@ def compute_overall_progress(user_courses):
         return 0
     return int(sum(c['progress'] for c in user_courses) / len(user_courses))
 
+# ------------------- Streak Engine -------------------
+def record_activity(roadmap, activity_date=None):
+    """Incrementally update a roadmap's streak columns for activity on activity_date."""
+    activity_date = activity_date or date.today()
+    last = roadmap.last_activity_date
+    if last and activity_date <= last:
+        return roadmap.current_streak
+    if last and (activity_date - last).days == 1:
+        roadmap.current_streak = (roadmap.current_streak or 0) + 1
+    else:
+        roadmap.current_streak = 1
+    roadmap.longest_streak = max(roadmap.longest_streak or 0, roadmap.current_streak)
+    roadmap.last_activity_date = activity_date
+    return roadmap.current_streak
+
+def get_user_streak(user):
+    """Best current streak across the user's roadmaps, as maintained by the streak engine.
+
+    Streaks are kept per UserRoadmap, so days spent on different roadmaps do not add up:
+    a user alternating between two roadmaps every day sees at most 1 or 2 here.
+    """
+    streak = db.session.query(db.func.max(UserRoadmap.current_streak)).filter(
+        UserRoadmap.user_id == user.id
+    ).scalar()
+    return streak or 0
+
+def migrate_legacy_streak(user, progress):
+    """Seed the streak columns once from the streak formerly kept in progress_data.json.
+
+    Pops the legacy 'streak'/'last_streak_date' keys from progress and returns True if
+    there were any, so the caller knows to save the progress file.
+    """
+    if not isinstance(progress, dict):
+        return False
+    legacy_streak = progress.pop('streak', None)
+    legacy_date = progress.pop('last_streak_date', None)
+    if legacy_streak is None and legacy_date is None:
+        return False
+    try:
+        last = datetime.strptime(legacy_date, '%Y-%m-%d').date() if legacy_date else None
+    except (TypeError, ValueError):
+        last = None
+    if not isinstance(legacy_streak, int) or isinstance(legacy_streak, bool) or legacy_streak <= 0:
+        return True
+    # A streak whose last day is before yesterday is already broken, so there is nothing to carry over
+    if not last or (date.today() - last).days > 1:
+        return True
+
+    latest_item = RoadmapItem.query.join(UserRoadmap).filter(
+        UserRoadmap.user_id == user.id,
+        RoadmapItem.completed_date.isnot(None)
+    ).order_by(RoadmapItem.completed_date.desc()).first()
+    if latest_item:
+        roadmap = latest_item.roadmap
+    else:
+        roadmap = UserRoadmap.query.filter_by(user_id=user.id).order_by(UserRoadmap.id.desc()).first()
+    if roadmap and roadmap.last_activity_date is None:
+        roadmap.current_streak = legacy_streak
+        roadmap.longest_streak = max(roadmap.longest_streak or 0, legacy_streak)
+        roadmap.last_activity_date = last
+        db.session.commit()
+    return True
+
+def run_streak_job(today=None, batch_size=STREAK_JOB_BATCH_SIZE):
+    """Reset broken streaks and queue reminders for streaks at risk, scanning roadmaps in batches."""
+    today = today or date.today()
+    yesterday = today - timedelta(days=1)
+    reset_count = 0
+    reminder_count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            UserRoadmap.id, UserRoadmap.user_id, UserRoadmap.current_streak,
+            UserRoadmap.last_activity_date, User.notifications
+        ).join(User).filter(
+            UserRoadmap.id > last_id,
+            UserRoadmap.current_streak > 0
+        ).order_by(UserRoadmap.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        broken_ids = [r.id for r in rows if r.last_activity_date is None or r.last_activity_date < yesterday]
+        if broken_ids:
+            # Re-check the date in the UPDATE so activity saved since the SELECT is not wiped out
+            reset_count += UserRoadmap.query.filter(
+                UserRoadmap.id.in_(broken_ids),
+                db.or_(UserRoadmap.last_activity_date.is_(None), UserRoadmap.last_activity_date < yesterday)
+            ).update({'current_streak': 0}, synchronize_session=False)
+            db.session.commit()
+
+        reminders = [
+            {
+                'user_id': r.user_id,
+                'roadmap_id': r.id,
+                'remind_date': today,
+                'current_streak': r.current_streak,
+                'sent': False
+            }
+            for r in rows if r.last_activity_date == yesterday and r.notifications
+        ]
+        if reminders:
+            # Another worker may be queueing the same reminders; let the unique constraint dedupe them
+            result = db.session.execute(
+                sqlite_insert(StreakReminder).values(reminders).on_conflict_do_nothing(
+                    index_elements=['roadmap_id', 'remind_date']
+                )
+            )
+            reminder_count += result.rowcount
+            db.session.commit()
+
+    logging.info("Streak job for %s: reset %d streaks, queued %d reminders", today, reset_count, reminder_count)
+    return reset_count, reminder_count
+
+def _seconds_until_next_run(now=None):
+    now = now or datetime.now()
+    next_run = now.replace(hour=STREAK_JOB_HOUR, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+def _streak_scheduler_loop():
+    while True:
+        try:
+            with app.app_context():
+                run_streak_job()
+        except Exception:
+            logging.exception("Streak job failed")
+            with app.app_context():
+                db.session.rollback()
+        time.sleep(_seconds_until_next_run())
+
+_streak_scheduler_started = False
+_streak_scheduler_lock = threading.Lock()
+
+def start_streak_scheduler():
+    """Run the streak job in a daemon thread; used by the dev server only."""
+    global _streak_scheduler_started
+    with _streak_scheduler_lock:
+        if _streak_scheduler_started:
+            return
+        _streak_scheduler_started = True
+    thread = threading.Thread(target=_streak_scheduler_loop, name='streak-scheduler', daemon=True)
+    thread.start()
+
+@app.cli.command('streak-job')
+def streak_job_command():
+    """Run the daily streak job once (for use from cron)."""
+    run_streak_job()
+
+@app.cli.command('streak-scheduler')
+def streak_scheduler_command():
+    """Run the streak job now and then daily, in the foreground (the procfile clock process)."""
+    db.create_all()
+    _streak_scheduler_loop()
+
 # ------------------- UNIVERSAL ROADMAP ROUTE -------------------
 @app.route('/<role>-roadmap')
 def serve_roadmap(role):
@@ -266,6 +437,7 @@ def save_progress_api():
     today = date.today().isoformat()
 
     progress = load_progress(user.username)
+    migrate_legacy_streak(user, progress)
     progress.setdefault('steps', {})
     progress['steps'][item_id] = {
         'checked': checked,
@@ -280,32 +452,38 @@ def save_progress_api():
 
     # If not found, try by step_code (step id in JSON, without course prefix)
     if not roadmap_item:
-        # Remove course prefix (everything up to the first '-')
-        if '-' in item_id:
-            step_code = item_id.split('-', 1)[1]  # e.g., 'frontend-step1-1' → 'step1-1'
+        # Split off the course prefix; step ids are always two parts, e.g. 'step1-1' or 'prereq-1'
+        parts = item_id.rsplit('-', 2)
+        if len(parts) == 3:
+            role_prefix = parts[0]  # e.g., 'cyber-security-step1-1' → 'cyber-security'
+            step_code = f"{parts[1]}-{parts[2]}"
         else:
+            role_prefix = None
             step_code = item_id
-        roadmap_item = RoadmapItem.query.join(UserRoadmap).filter(
+        query = RoadmapItem.query.join(UserRoadmap).filter(
             RoadmapItem.step_code == step_code,
             UserRoadmap.user_id == user.id
-        ).first()
+        )
+        if role_prefix:
+            # Step codes repeat across roadmaps, so only look in the user's latest roadmap for this role
+            user_roadmaps = UserRoadmap.query.filter_by(user_id=user.id).order_by(UserRoadmap.id.desc()).all()
+            user_roadmap = next(
+                (r for r in user_roadmaps if r.role.lower().replace('_', '-').replace(' ', '-') == role_prefix),
+                None
+            )
+            roadmap_item = query.filter(UserRoadmap.id == user_roadmap.id).first() if user_roadmap else None
+        else:
+            roadmap_item = query.first()
 
     if roadmap_item:
         roadmap_item.is_completed = checked
         roadmap_item.completed_date = date.today() if checked else None
+        if checked:
+            record_activity(roadmap_item.roadmap)
         db.session.commit()
 
-    if checked:
-        last_streak_date = progress.get('last_streak_date')
-        if last_streak_date != today:
-            if last_streak_date and (date.today() - datetime.strptime(last_streak_date, '%Y-%m-%d').date()).days == 1:
-                progress['streak'] = progress.get('streak', 0) + 1
-            else:
-                progress['streak'] = 1
-            progress['last_streak_date'] = today
-
     save_progress(user.username, progress)
-    return jsonify({'status': 'success', 'streak': progress.get('streak', 0)})
+    return jsonify({'status': 'success', 'streak': get_user_streak(user)})
 
 @app.route('/get_progress')
 def get_progress_api():
@@ -323,6 +501,11 @@ def api_save_progress():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
     data = request.get_json()
+    # Migrate from the stored file before it is overwritten; never trust a client-sent streak
+    migrate_legacy_streak(user, load_progress(user.username))
+    if isinstance(data, dict):
+        data.pop('streak', None)
+        data.pop('last_streak_date', None)
     save_progress(user.username, data)
     return jsonify({'status': 'success'})
 
@@ -332,6 +515,10 @@ def api_load_progress():
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
     progress = load_progress(user.username)
+    if migrate_legacy_streak(user, progress):
+        save_progress(user.username, progress)
+    # The streak badge reads this on page load, so serve the database value
+    progress['streak'] = get_user_streak(user)
     return jsonify(progress)
 
 @app.route('/')
@@ -546,20 +733,11 @@ def activity():
 
     user_progress = compute_overall_progress(user_courses)
 
-    # --- Show correct streak based on progress file ---
+    # --- Streak is maintained by the streak engine and the daily streak job ---
     progress = load_progress(user.username)
-    streak = progress.get('streak', 0)
-    last_streak_date = progress.get('last_streak_date')
-    if last_streak_date:
-        try:
-            last_streak_date_dt = datetime.strptime(last_streak_date, '%Y-%m-%d').date()
-            if (today - last_streak_date_dt).days == 1:
-                streak += 1
-            elif (today - last_streak_date_dt).days > 1:
-                streak = 1
-        except ValueError:
-            pass
-    user_streak = streak
+    if migrate_legacy_streak(user, progress):
+        save_progress(user.username, progress)
+    user_streak = get_user_streak(user)
 
     last_week_progress = 0
     if len(week_data) >= 2 and sum(week_data) > 0:
@@ -653,4 +831,7 @@ def settings():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    # Only start the scheduler in the reloader child, not in the watching parent
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_streak_scheduler()
     app.run(debug=True)
\ No newline at end of file